@@ -31,6 +31,10 @@ If you want to use a template gdb for creating your DR gdb, it should contain a
 used to have a template that disabled the default check for invalid geometries (but that seems to be the default
 behaviour since ~10.4).
 
+Setting the environment variable DRBOT_RAM_WS=1 makes DRBot work on a copy of the DR gdb in RAM during the run (in
+DRBOT_RAM_DIR if set, e.g. a RAM drive on Windows, otherwise in /dev/shm), and copy it back to the DR gdb location
+afterwards. If no RAM location is available, or the copy into RAM fails, the DR gdb is used directly.
+
 TODO:
 - include information in the email about which rbj files triggered each findings
 - clean up error handling in clean_dr_ws(), make_dr_gdb(), prep_dr_ws() (and everywhere else...)
@@ -40,23 +44,49 @@ Author: Hanne L. Petersen <halpe@sdfe.dk>
 Download: https://github.com/Kortforsyningen/drbot
 """
 import os
+import collections
+import itertools
+import operator
+import re
 import sys
+import ntpath
 import shutil
+import smtplib
+import subprocess
+import tempfile
 from datetime import datetime as dt
+from email.header import Header
+from email.mime.text import MIMEText
 import traceback
+try:
+    from cStringIO import StringIO  # Python 2, accepts the (byte) str lines logged there
+except ImportError:
+    from io import StringIO
 
 import arcpy
 
 found_marker = "Found"  # indicator of errors in log file/mail, and used for counting for the summary
 
+# Where clauses for the DR gdb tables. The DR workspace is a file gdb, so field names don't need delimiters.
+session_where_tmpl = "SESSIONNAME = '{}'"
+sessionid_where_tmpl = "SESSIONID = {}"
+
+# Error number in arcpy error messages, e.g. 'ERROR 000732: ...'
+arc_error_re = re.compile(r'ERROR 0+([1-9]\d*):')
+
 # Organisation's email settings
 email_server = "smtp.organisation.net"
 email_sender = "Batch Script <batch_user@organisation.net>"
+email_use_ssl = False  # connect with SMTP_SSL instead of (optional) STARTTLS on a plain connection
+email_login = None  # (user, password) if the server requires authentication
 
 
-class DRBot:
+class DRBot(object):
     """A class to run Data Reviewer's rbj-files and report output."""
 
+    __slots__ = ('db', 'dr_gdb_location', 'template_dr_gdb', 'coord_sys', 'tmp_log',
+                 '_final_loc', '_gdb_exists')
+
     def __init__(self, db, dr_gdb_location, template_dr_gdb='', coord_sys=arcpy.SpatialReference(4326)):
         """
         Initialise the DRBot object.
@@ -71,6 +101,9 @@ class DRBot:
         self.template_dr_gdb = template_dr_gdb
         self.coord_sys = coord_sys
         self.tmp_log = TmpLog()  # Initialise log
+        self._final_loc = None  # The real DR gdb location while dr_gdb_location points to a RAM copy
+        self._gdb_exists = False  # Whether dr_gdb_location exists, as of the last _refresh_gdb_state()
+        self._refresh_gdb_state()
 
     def run_from_sysargs(self, def_rules):
         """Run a DRBot check from command line inputs."""
@@ -99,15 +132,18 @@ class DRBot:
         self.runDR(rules, sess_name)
 
         self.report_output(logfile, mails, rules.split('\\')[-1])
+        self.tmp_log.close()
 
     def report_output(self, logfile, mails, subj, always_send_mail=True):
         """Report output (from tmp_log) to desired channels."""
         if mails == [""]:
             mails = ""
 
+        body_text = self.tmp_log.text()  # Shared by log file and email
+
         # Write output to log file
         if len(logfile) > 0:
-            self.tmp_log.write_to_file(logfile)
+            self.tmp_log.write_text(logfile, body_text)
 
         # Check if errors have been found and there's someone to email
         if not always_send_mail and len(mails) > 0:
@@ -116,14 +152,37 @@ class DRBot:
 
         # Send log contents to email
         if always_send_mail and len(mails) > 0:
-            self.tmp_log.send_email(email_sender, mails, 'DRBot Run, {}'.format(subj), found_marker)
+            self.tmp_log.send_email_text(email_sender, mails, 'DRBot Run, {}'.format(subj), found_marker, body_text)
+
+    _fixed_paths = {}  # Cache for fix_path, since rule lists tend to repeat the same (relative) paths
 
     @staticmethod
     def fix_path(path, basepath):
         """If path is relative, make it absolute by prefixing basepath."""
-        if path[1] != ":" and path[0] != "/":
-            return os.path.join(basepath, path)
-        return path
+        key = (path, basepath)
+        if key not in DRBot._fixed_paths:
+            # Windows paths are recognised on any platform (drive letter or UNC share, or rooted in / or \)
+            is_absolute = ntpath.splitdrive(path)[0] != '' or path[:1] in ('/', '\\')
+            DRBot._fixed_paths[key] = path if is_absolute else os.path.join(basepath, path)
+        return DRBot._fixed_paths[key]
+
+    def existing_rulefiles(self, rulefiles):
+        """
+        Return rulefiles without duplicates and missing files (keeping the order).
+
+        Missing files are reported in tmp_log here, since DR only reports them after the (slow) tool setup.
+        """
+        seen = set()
+        existing = []
+        for rulefile in rulefiles:
+            if rulefile in seen:
+                continue
+            seen.add(rulefile)
+            if os.path.isfile(rulefile):
+                existing.append(rulefile)
+            else:
+                self.tmp_log.log("Found execution error: File {} not found.".format(rulefile))
+        return existing
 
     def runDR(self, rules, sess_keywd):
         """Run Data Reviewer with the specified rules. Report output to DR gdb and tmp_log."""
@@ -135,12 +194,13 @@ class DRBot:
         session_name = sess_keywd  # + " - " + time.strftime('%H') + "h, scheduled DR session"
 
         set_msg("Loading rule file(s) from {}...".format(rules))
-        if '.txt' in rules:  # if it's a txt file, read it as lines of rbj files
+        if rules.lower().endswith('.txt'):  # if it's a txt file, read it as lines of rbj files
             try:
                 with open(rules, 'r') as indata:
-                    # Get file contents, skip lines starting with #
-                    rulefiles = [DRBot.fix_path(lin, os.path.dirname(rules))
-                                 for lin in indata.read().splitlines() if lin[:1] != "#"]
+                    # Get file contents, skip empty lines and lines starting with #
+                    base = os.path.dirname(rules)
+                    rulefiles = [DRBot.fix_path(lin.rstrip('\r\n'), base)
+                                 for lin in indata if lin[:1] not in ('#', '\n', '\r')]
             except IOError as exc:
                 set_msg("ERROR reading rules {}.".format(rules))
                 if exc[0] == 2:
@@ -152,39 +212,34 @@ class DRBot:
             rulefiles = [rules]
 
         t0 = dt.now()
+        self._refresh_gdb_state()
 
         try:
+            if os.environ.get('DRBOT_RAM_WS') == '1':
+                self._move_ws_to_ram()
+
+            rulefiles = self.existing_rulefiles(rulefiles)
+
             # Ensure that we have a Data Reviewer Session (create gdb etc. if necessary)
-            self.prep_dr_ws(session_name)
+            sess_obj_id = self.prep_dr_ws(session_name)
 
-            # Find session in table, and get its session id
-            sessionnamefld = arcpy.AddFieldDelimiters(self.dr_gdb_location + "\\GDB_REVSESSIONTABLE", "SESSIONNAME")
-            session_where = "%s = '%s'" % (sessionnamefld, session_name)
-            cur = arcpy.SearchCursor(self.dr_gdb_location + "\\GDB_REVSESSIONTABLE", session_where)
-            for row in cur:
-                sess_obj_id = row.getValue("SESSIONID")
+            # If the tool result didn't tell, find session in table, and get its session id
+            if sess_obj_id is None:
+                sess_obj_id = self.find_session_id(session_name)
 
             # This is the string value needed to WRITE to the newly created session
             # Note: This *must* have this format, with space before the colon, or the script will fail!
             sessionidstr = "Session %d : %s" % (sess_obj_id, session_name)
             set_msg("  Created session:\n    %s" % sessionidstr)
             self.tmp_log.log("Checking {}".format(self.db))
-            self.tmp_log.log("Errors will be written to {}".format(self.dr_gdb_location))
+            self.tmp_log.log("Errors will be written to {}".format(self._final_loc or self.dr_gdb_location))
 
             # Check using each rule file
+            # The rbj files are deliberately not merged into one batch job: rewriting them with ElementTree drops the
+            # namespace declarations only used in xsi:type values, and DR would record the temporary merged file
+            # instead of the actual rbj in REVCHECKRUNTABLE.
             for rulefile in rulefiles:
-                set_msg('  Checking file: '+rulefile)
-                try:
-                    print("Rules: "+rulefile)
-                    arcpy.ExecuteReviewerBatchJob_Reviewer(self.dr_gdb_location, sessionidstr, rulefile, self.db)
-                except arcpy.ExecuteError as ee:
-                    # print(arcpy.GetMessages())
-                    err = parse_arc_error(ee)
-                    if err == 732:
-                        self.tmp_log.log("Found execution error: File {} not found.".format(rulefile))
-                        # print(repr(ee))
-                    else:
-                        raise ee
+                self._run_rbj(rulefile, sessionidstr)
 
             set_msg("Checks completed, summarising output.\n\n")
             self.summarise_dr_output(sess_obj_id)
@@ -193,6 +248,9 @@ class DRBot:
             set_msg("Exception during DRBot " + str(exc))
             set_msg(traceback.format_exc())
 
+        if self._final_loc is not None:
+            self._sync_ws_from_ram()
+
         # Check in the Data Reviewer extension
         arcpy.CheckInExtension("datareviewer")
 
@@ -201,13 +259,101 @@ class DRBot:
         dur_run = dt.now() - t0
         self.tmp_log.log("\nTotal " + __file__ + " duration (h:mm:ss.dd): " + str(dur_run)[:-3])
 
+    def _move_ws_to_ram(self):
+        """
+        Point dr_gdb_location to a copy of the DR gdb in a RAM backed folder (see DRBOT_RAM_WS).
+
+        Keep using the DR gdb directly if there is no RAM folder, or it can't be copied there.
+        """
+        ram_dir = os.environ.get('DRBOT_RAM_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else None)
+        if ram_dir is None or not os.path.isdir(ram_dir):
+            set_msg("No RAM folder for the DR gdb (set DRBOT_RAM_DIR), using " + self.dr_gdb_location)
+            return
+
+        ram_root = None
+        try:
+            ram_root = tempfile.mkdtemp(prefix='drbot_', dir=ram_dir)
+            ram_loc = os.path.join(ram_root, os.path.basename(self.dr_gdb_location.rstrip('/\\')))
+            if os.path.isdir(self.dr_gdb_location):
+                copy_gdb(self.dr_gdb_location, ram_loc)
+        except Exception as exc:
+            set_msg("Couldn't copy DR gdb to RAM, using " + self.dr_gdb_location)
+            set_msg(traceback.format_exc())
+            if ram_root is not None:
+                shutil.rmtree(ram_root, ignore_errors=True)
+            return
+
+        set_msg("Using DR gdb in RAM: " + ram_loc)
+        self._final_loc = self.dr_gdb_location
+        self.dr_gdb_location = ram_loc
+        self._refresh_gdb_state()
+
+    def _sync_ws_from_ram(self):
+        """
+        Copy the RAM copy of the DR gdb back to its real location, and point dr_gdb_location there again.
+
+        The copy is made next to the DR gdb and swapped in by renaming, so a failed copy leaves the DR gdb untouched.
+        """
+        ram_loc = self.dr_gdb_location
+        self.dr_gdb_location = self._final_loc
+        self._final_loc = None
+        new_loc = self.dr_gdb_location + ".drbot_new"
+        old_loc = self.dr_gdb_location + ".drbot_old"
+        set_msg("Copying DR gdb from RAM to " + self.dr_gdb_location + "...")
+        try:
+            for loc in (new_loc, old_loc):  # leftovers from an earlier failed sync
+                if os.path.isdir(loc):
+                    shutil.rmtree(loc)
+            copy_gdb(ram_loc, new_loc)
+            if os.path.isdir(self.dr_gdb_location):
+                os.rename(self.dr_gdb_location, old_loc)
+            os.rename(new_loc, self.dr_gdb_location)
+        except Exception as exc:
+            set_msg("Couldn't copy DR gdb from RAM, it is left in " + ram_loc)
+            set_msg(traceback.format_exc())
+            if not os.path.isdir(self.dr_gdb_location) and os.path.isdir(old_loc):
+                os.rename(old_loc, self.dr_gdb_location)
+            shutil.rmtree(new_loc, ignore_errors=True)
+        else:
+            shutil.rmtree(old_loc, ignore_errors=True)
+            shutil.rmtree(os.path.dirname(ram_loc), ignore_errors=True)
+        self._refresh_gdb_state()
+
+    def _refresh_gdb_state(self):
+        """Stat dr_gdb_location once, and remember whether it exists (as a folder)."""
+        self._gdb_exists = os.path.isdir(self.dr_gdb_location)
+
+    def find_session_id(self, session_name):
+        """Find session_name in the session table of the DR gdb, and return its session id."""
+        session_where = session_where_tmpl.format(session_name.replace("'", "''"))
+        with arcpy.da.SearchCursor(self.dr_gdb_location + "\\GDB_REVSESSIONTABLE", ["SESSIONID"],
+                                   where_clause=session_where) as cur:
+            return max(row[0] for row in cur)  # session names may repeat, use the newest
+
+    def _run_rbj(self, rulefile, sessionidstr):
+        """Execute a single rbj file against the data, writing into the given DR session."""
+        set_msg('  Checking file: '+rulefile)
+        try:
+            print("Rules: "+rulefile)
+            arcpy.ExecuteReviewerBatchJob_Reviewer(self.dr_gdb_location, sessionidstr, rulefile, self.db)
+        except arcpy.ExecuteError as ee:
+            # print(arcpy.GetMessages())
+            err = parse_arc_error(ee)
+            if err == 732:
+                self.tmp_log.log("Found execution error: File {} not found.".format(rulefile))
+                # print(repr(ee))
+            else:
+                raise ee
+
     def clean_dr_ws(self):
         """Clean out any existing DR workspace gdb (delete and create)."""
         set_msg("Cleaning up DR gdb...")
-        if os.path.isdir(self.dr_gdb_location):
+        self._refresh_gdb_state()
+        if self._gdb_exists:
             try:
                 set_msg("Deleting DR gdb " + self.dr_gdb_location + "...")
                 shutil.rmtree(self.dr_gdb_location)
+                self._gdb_exists = False
             except Exception as exc:
                 set_msg("Failed to delete existing DR gdb.")
                 if exc[0] == 32:
@@ -223,7 +369,7 @@ class DRBot:
         set_msg("Making DR gdb...")
         if os.path.isdir(self.template_dr_gdb):  # Create using template
             try:
-                shutil.copytree(self.template_dr_gdb, self.dr_gdb_location)
+                copy_gdb(self.template_dr_gdb, self.dr_gdb_location)
             except shutil.Error as exc:
                 set_msg("  Couldn't copy DR gdb template (shutil.Error).")
                 set_msg("  errors: " + str(exc.args[0]))
@@ -236,13 +382,15 @@ class DRBot:
                     # set_msg(repr(exc))
                     # set_msg(traceback.format_exc())
                 pass
+            self._refresh_gdb_state()
         # if DRgdb[:-1] in ('/', '\\'):  # don't allow trailing slash (os.path.dirname will fail)
         #     DRgdb = DRgdb[0:-1]
-        if not os.path.isdir(self.dr_gdb_location):
+        if not self._gdb_exists:
             set_msg("Creating empty fgdb for DR...")
             try:
                 arcpy.CreateFileGDB_management(os.path.dirname(self.dr_gdb_location),
                                                os.path.basename(self.dr_gdb_location))
+                self._refresh_gdb_state()
                 # if it's already enabled, this apparently just does nothing
                 arcpy.EnableDataReviewer_Reviewer(self.dr_gdb_location, self.coord_sys)
             except Exception as esc:
@@ -254,47 +402,51 @@ class DRBot:
         Ensure that we have a valid Data Reviewer Session (create gdb etc. if necessary).
         
         Use 'Session 1 : empty' as session template if available.
+        Return the id of the created session, or None if it can't be read from the tool result.
         """
         set_msg("Preparing Data Reviewer Session...")
+        result = None
 
-        if not os.path.isdir(self.dr_gdb_location):
+        if not self._gdb_exists:
             self.make_dr_gdb()
 
         # Create session
         set_msg("    Database: " + self.dr_gdb_location)
         try:
-            arcpy.CreateReviewerSession_Reviewer(self.dr_gdb_location, session_name, 'Session 1 : empty')
+            result = arcpy.CreateReviewerSession_Reviewer(self.dr_gdb_location, session_name, 'Session 1 : empty')
         except arcpy.ExecuteError as exc:  # an ExecuteError is thrown if 'Session 1 : empty' doesn't exist
             set_msg("  Couldn't create reviewer session from template, ignoring template.")
             # if exc[0] == 837:
             #     set_msg("  " + exc[1])  # workspace is not the correct workspace type
             try:
                 # self.tmp_log.log("Warning found: couldn't use workspace template.")
-                arcpy.CreateReviewerSession_Reviewer(self.dr_gdb_location, session_name)
+                result = arcpy.CreateReviewerSession_Reviewer(self.dr_gdb_location, session_name)
             except Exception as exc2:
                 set_msg("Problem while creating empty reviewer session: ")
                 set_msg(traceback.format_exc())
 
+        return parse_session_id(result, session_name)
+
     def summarise_dr_output(self, sess_obj_id):
         """Read the REVTABLEMAIN table from the DR gdb to examine the findings, summarise into tmp_log."""
         fields = ["CHECKTITLE", "ORIGINTABLE", "SUBTYPE", "OBJECTID", "NOTES"]
-        check_count = 0
-        prev_check = ''
-        for row in arcpy.da.SearchCursor(self.dr_gdb_location + '/REVTABLEMAIN', fields,
-                                         where_clause='SESSIONID=' + str(sess_obj_id),
-                                         sql_clause=('', 'ORDER BY CHECKTITLE, OBJECTID')):
-            (title, fc, fcs, objectid, notes) = row
-            if title != prev_check:
-                if prev_check != '':
-                    self.tmp_log.log("Total {} DRBot hits for {}\n".format(check_count, prev_check))
-                prev_check = title
+        # Local names for the per-row loop; lines are collected and handed to tmp_log in one go
+        hit_fmt = found_marker + " {}{}, OBJECTID={}: {} ({})"
+        enc = encode_if_unicode
+        lines = []
+        add_line = lines.append
+        with arcpy.da.SearchCursor(self.dr_gdb_location + '/REVTABLEMAIN', fields,
+                                   where_clause=sessionid_where_tmpl.format(int(sess_obj_id)),
+                                   sql_clause=(None, 'ORDER BY CHECKTITLE, OBJECTID')) as cur:
+            for (title, rows) in itertools.groupby(cur, key=operator.itemgetter(0)):
+                title_str = enc(title)
                 check_count = 0
-            check_count += 1
-            fcs_str = ", " + fcs[:6] if len(fcs) > 0 else ""
-            self.tmp_log.log(found_marker + " {}{}, OBJECTID={}: {} ({})"
-                             .format(fc, fcs_str, objectid, encode_if_unicode(title), encode_if_unicode(notes)))
-        if prev_check != '':
-            self.tmp_log.log("Total {} DRBot hits for {}\n".format(check_count, prev_check))
+                for (_, fc, fcs, objectid, notes) in rows:
+                    check_count += 1
+                    fcs_str = ", " + fcs[:6] if len(fcs) > 0 else ""
+                    add_line(hit_fmt.format(fc, fcs_str, objectid, title_str, enc(notes)))
+                add_line("Total {} DRBot hits for {}\n".format(check_count, title_str))
+        self.tmp_log.log_lines(lines)
 
         # TODO: look in REVCHECKRUNTABLE for the rbj filename and print it here; using the column CHECKRUNID
 
@@ -308,25 +460,69 @@ def set_msg(s):
     arcpy.AddMessage(s)
 
 
-def encode_if_unicode(strval):
-    """Encode if string is unicode."""
-    try:
-        if isinstance(strval, unicode):
+try:
+    unicode_type = unicode  # Python 2
+except NameError:  # Python 3, where str is already unicode
+    def encode_if_unicode(strval):
+        """Encode if string is unicode."""
+        return strval if isinstance(strval, str) else str(strval)
+else:
+    def encode_if_unicode(strval):
+        """Encode if string is unicode."""
+        if isinstance(strval, unicode_type):
             return strval.encode('utf8')
-    except:
-        pass
-    return str(strval)
+        return str(strval)
+
+
+def copy_gdb(src, dst):
+    """
+    Copy the gdb folder src to dst, which shouldn't exist already.
+
+    Use the multi-threaded robocopy on Windows, and cp (with copy-on-write where the file system supports it)
+    elsewhere. Fall back to shutil.copytree if those aren't available or fail.
+    """
+    if not os.path.exists(dst):
+        if os.name == 'nt':
+            cmd = ["robocopy", src, dst, "/E", "/MT:16", "/NFL", "/NDL", "/NJH", "/NJS"]
+            max_ok = 7  # robocopy exit codes below 8 mean success
+        else:
+            cmd = ["cp", "-a", "--reflink=auto", src, dst]
+            max_ok = 0
+        try:
+            with open(os.devnull, 'w') as devnull:
+                if subprocess.call(cmd, stdout=devnull, stderr=devnull) <= max_ok:
+                    return
+        except OSError:  # command not found
+            pass
+        shutil.rmtree(dst, ignore_errors=True)  # clean up after a partial copy
+    shutil.copytree(src, dst)
 
 
 def parse_arc_error(e):
-    import re
-    obj = re.search('ERROR 0+([1-9]\d*):', e.message)
+    """Return the error number of an arcpy.ExecuteError, re-raise e if there is none."""
+    obj = arc_error_re.search(e.args[0] if e.args else '')
     if obj is None:
         raise e
     return int(obj.group(1))
 
 
-class TmpLog:
+def parse_session_id(result, session_name):
+    """Return the id of session_name from a CreateReviewerSession result, or None if it isn't there."""
+    if result is None:
+        return None
+    session_re = re.compile(r'Session (\d+) : ' + re.escape(session_name) + '$', re.MULTILINE)
+    try:
+        texts = [str(result.getOutput(i)) for i in range(result.outputCount)] + [result.getMessages()]
+    except Exception:
+        return None
+    for text in texts:
+        obj = session_re.search(text)
+        if obj is not None:
+            return int(obj.group(1))
+    return None
+
+
+class TmpLog(object):
     """
     A class to store and use temporary logs, i.e. until end of script execution.
 
@@ -336,59 +532,126 @@ class TmpLog:
     (unless handed over to somewhere else before that).
     """
 
+    __slots__ = ('_buf', '_ends', '_markers', '_marker_counts')
+
+    _smtp = None  # SMTP connection shared by all logs, opened on first use and kept until close()
+
     def __init__(self):
-        self.tmp_log_list = []  # Collector for logged items
+        self._buf = StringIO()  # Collector for logged items, each followed by a newline
+        self._ends = []  # End offset in _buf of each logged item (items may themselves contain newlines)
+        self._markers = {found_marker}  # Strings for which matching lines are counted while logging
+        self._marker_counts = collections.Counter()
         pass
 
     def log(self, msg):
         """Log msg. At most until end of execution."""
-        self.tmp_log_list.append(str(msg))
+        msg = str(msg)
+        self._write_items([msg])
+        for marker in self._markers:
+            if marker in msg:
+                self._marker_counts[marker] += 1
+
+    def log_lines(self, lines):
+        """Log each of lines, like calling log() for each of them."""
+        lines = [str(msg) for msg in lines]
+        self._write_items(lines)
+        for marker in self._markers:
+            self._marker_counts[marker] += sum(1 for msg in lines if marker in msg)
+
+    def _write_items(self, items):
+        """Write items to the buffer, and remember where each of them ends."""
+        pos = self._ends[-1] if self._ends else 0
+        for msg in items:
+            self._buf.write(msg)
+            self._buf.write("\n")
+            pos += len(msg) + 1
+            self._ends.append(pos)
+
+    @property
+    def tmp_log_list(self):
+        """The logged items, as a list."""
+        text = self._buf.getvalue()
+        starts = [0] + self._ends[:-1]
+        return [text[start:end - 1] for (start, end) in zip(starts, self._ends)]
 
     def count_lines_with(self, s):
         """Count the number of lines in log containing s."""
-        cnt = 0
-        for itm in self.tmp_log_list:
-            if s in itm:
-                cnt += 1
-        return cnt
+        if s not in self._markers:  # Count existing logged items once, then keep counting in log()
+            self._markers.add(s)
+            self._marker_counts[s] = sum(1 for itm in self.tmp_log_list if s in itm)
+        return self._marker_counts[s]
 
     def contains_line_with(self, s):
         """Check if any line in log contains s."""
-        for itm in self.tmp_log_list:
-            if s in itm:
-                return True
-        return False
+        return self.count_lines_with(s) > 0
+
+    def text(self):
+        """Return contents of log as one string, one line per logged item."""
+        return self._buf.getvalue()
 
     def write_to_file(self, filename):
         """Write contents of log to file."""
+        self.write_text(filename, self.text())
+
+    @staticmethod
+    def write_text(filename, text):
+        """Write text (e.g. from text()) to file."""
         with open(filename, 'w') as the_file:
-            for logline in self.tmp_log_list:
-                the_file.write("%s\n" % logline)
+            the_file.write(text)
 
     def send_email(self, sender, email_lst, subject, count_flag):
         """Email the contents of the log to email_lst, reporting occurrences of countFlag in email subject."""
-        import smtplib
-        message = ''
-        issue_count = 0
-        for logline in self.tmp_log_list:
-            message += "{}\n".format(logline)
-            if count_flag in str(logline):
-                issue_count += 1
-        if count_flag != '':
-            subject = "{} - {} issues".format(subject, issue_count)
-        body = """From: %s\nTo: %s\nSubject: %s\n\n%s
-        """ % (sender, ", ".join(email_lst), subject, message)
+        self.send_email_text(sender, email_lst, subject, count_flag, self.text())
 
-        # Send the email
+    def send_email_text(self, sender, email_lst, subject, count_flag, message):
+        """Email message (e.g. from text()) to email_lst, reporting occurrences of countFlag in email subject."""
+        if count_flag != '':
+            subject = "{} - {} issues".format(subject, self.count_lines_with(count_flag))
+        msg = MIMEText(message, 'plain', 'utf-8')
+        msg['From'] = sender
+        msg['To'] = ", ".join(email_lst)
+        msg['Subject'] = Header(subject, 'utf-8')
+        body = msg.as_string()
+
+        # Send the email (reconnect once if the server has dropped the kept connection)
         try:
-            server = smtplib.SMTP(email_server)
-            server.sendmail(sender, email_lst, body)
-            server.quit()
+            try:
+                self._ensure_smtp().sendmail(sender, email_lst, body)
+            except smtplib.SMTPServerDisconnected:
+                TmpLog._smtp = None
+                self._ensure_smtp().sendmail(sender, email_lst, body)
         except Exception as e:
             print("Couldn't send email.")
             print(repr(e))
         pass
 
+    @staticmethod
+    def _ensure_smtp():
+        """Return the shared SMTP connection, connecting (and negotiating TLS/login) if not already connected."""
+        if TmpLog._smtp is None:
+            if email_use_ssl:
+                server = smtplib.SMTP_SSL(email_server)
+            else:
+                server = smtplib.SMTP(email_server)
+                server.ehlo()
+                if server.has_extn('starttls'):
+                    server.starttls()
+                    server.ehlo()
+            if email_login is not None:
+                server.login(*email_login)
+            TmpLog._smtp = server
+        return TmpLog._smtp
+
+    @staticmethod
+    def close():
+        """Close the shared SMTP connection, if open."""
+        if TmpLog._smtp is not None:
+            try:
+                TmpLog._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            TmpLog._smtp = None
+
 
 if __name__ == "__main__":
 
@@ -408,3 +671,4 @@ if __name__ == "__main__":
         sess_name = log_loc[1 + log_loc.rfind('\\'):]
         test_drb.runDR(rule_loc, sess_name)
         test_drb.report_output(log_loc, sendmails, 'DRBot run, {}'.format(rule_loc.split('\\')[-1]), False)
+        test_drb.tmp_log.close()